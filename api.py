@@ -1,34 +1,98 @@
-import requests
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type, retry_if_result
-from requests.exceptions import RequestException
+import asyncio
+from datetime import datetime
+import httpx
+from aiolimiter import AsyncLimiter
+from tenacity import retry, stop_after_attempt, wait_fixed, wait_random_exponential, retry_if_exception_type, retry_if_result
 
 # Define what is a "bad" response that needs a retry
 def is_rate_limit_or_server_error(response):
     """Return True if the response status code is 429 or 5xx."""
     return response.status_code == 429 or response.status_code >= 500
 
-class JiraAPI:
+# 2s plus full jitter: a random extra wait of up to 1s, 2s, 4s, 8s, 16s, 32s (58s max),
+# so concurrent requests that hit a 429 together don't all retry in lockstep.
+_jittered_backoff = wait_fixed(2) + wait_random_exponential(multiplier=1, max=58)
+
+# Longest Retry-After we honor, so a bogus header can't stall a request indefinitely
+_MAX_RETRY_AFTER = 60
+
+def wait_retry_after_or_backoff(retry_state):
+    """Wait as long as the server's Retry-After header asks, else back off with jitter."""
+    outcome = retry_state.outcome
+    if not outcome.failed:
+        retry_after = outcome.result().headers.get("Retry-After", "")
+        # Only the delay-seconds form is handled; HTTP-dates fall back to backoff
+        if retry_after.isdigit():
+            return min(int(retry_after), _MAX_RETRY_AFTER)
+    return _jittered_backoff(retry_state)
+
+def to_jql_datetime(timestamp):
+    """
+    Converts a Jira timestamp (e.g. '2024-01-31T10:05:33.123+0000') to JQL's
+    'yyyy-MM-dd HH:mm' format. JQL has minute precision, so this rounds down,
+    which can only widen an 'updated >=' search. The UTC offset is dropped: Jira
+    interprets JQL dates in the same time zone it formats timestamps in.
+    """
+    return timestamp[:16].replace("T", " ")
+
+def parse_jira_datetime(timestamp):
+    """Parses a Jira timestamp (e.g. '2024-01-31T10:05:33.123+0000') into an aware datetime."""
+    return datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S.%f%z")
+
+class AsyncJiraAPI:
     BASE_URL = "https://issues.apache.org/jira/rest/api/2"
 
-    def __init__(self):
-        self.session = requests.Session()
-        self.session.headers.update({
-            "User-Agent": "LLM-Corpus-Scraper (github.com/Naman-Bhalla)"
-        })
+    def __init__(self, concurrency=10, requests_per_second=8):
+        self.concurrency = concurrency
+        self.client = None
+        # Caps the number of requests in flight at once to respect Jira's rate limits
+        self.semaphore = asyncio.BoundedSemaphore(concurrency)
+        # Token bucket that keeps us under Jira's rate limit up front,
+        # rather than only backing off once it answers with a 429
+        self.limiter = AsyncLimiter(max_rate=requests_per_second, time_period=1)
+
+    async def __aenter__(self):
+        # One client (and connection pool) per project run. Over HTTP/2 the
+        # concurrent searches are multiplexed on one TLS connection.
+        self.client = httpx.AsyncClient(
+            headers={
+                "User-Agent": "LLM-Corpus-Scraper (github.com/Naman-Bhalla)",
+                "Accept": "application/json",
+                # Comment-heavy payloads compress well; ask for it explicitly
+                "Accept-Encoding": "gzip, deflate"
+            },
+            timeout=15.0,
+            # requests and aiohttp followed redirects by default; httpx doesn't
+            follow_redirects=True,
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+                # Transparently retries failed connection attempts, before tenacity gets involved
+                retries=3
+            )
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.client.aclose()
 
     @retry(
         # Try 7 times before giving up
-        stop=stop_after_attempt(7),  
-        # Wait 2s, then 4s, 8s, 16s, 32s, 60s (max)
-        wait=wait_exponential(multiplier=1, min=2, max=60),  
+        stop=stop_after_attempt(7),
+        # Honor Retry-After, otherwise jittered exponential backoff
+        wait=wait_retry_after_or_backoff,
         # Retry on network errors OR if the function returns a 429/5xx response
-        retry=(retry_if_exception_type(RequestException) | retry_if_result(is_rate_limit_or_server_error))
+        retry=(retry_if_exception_type(httpx.RequestError) | retry_if_result(is_rate_limit_or_server_error))
     )
-    def _make_request(self, method, url, **kwargs):
+    async def _make_request(self, method, url, **kwargs):
         """A single, retry-enabled request method."""
         try:
-            response = self.session.request(method, url, timeout=15, **kwargs)
-            
+            # Only hold a concurrency slot while the request is actually in flight,
+            # not while tenacity is sleeping between retries. Every attempt,
+            # including retries, spends a rate-limit token.
+            async with self.semaphore, self.limiter:
+                response = await self.client.request(method, url, **kwargs)
+
             # If we get a 429 or 5xx, we want to retry.
             # We return the response object to let tenacity's `retry_if_result` check it.
             if is_rate_limit_or_server_error(response):
@@ -36,43 +100,70 @@ class JiraAPI:
                 return response
 
             # For other 4xx errors (like 404 Not Found), raise an exception immediately.
-            response.raise_for_status()  
-            
+            response.raise_for_status()
+
             return response
-            
-        except RequestException as e:
+
+        except httpx.RequestError as e:
             # This catches connection errors, timeouts, etc.
-            print(f"Network error: {e}. Retrying...")
+            print(f"Network error: {e!r}. Retrying...")
             raise  # Re-raise to trigger tenacity's retry_if_exception_type
 
-    def search_issues(self, project_key, start_at=0, max_results=50):
+    async def _search(self, params):
+        """Runs a JQL search and returns the decoded JSON response."""
+        url = f"{self.BASE_URL}/search"
+        response = await self._make_request("GET", url, params=params)
+
+        # If we exit the retry loop and still have a bad response, raise an error
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch data after retries. Final status: {response.status_code} {response.text}")
+
+        return response.json()
+
+    async def search_issues(self, project_key, start_at=0, max_results=50, updated_since=None):
         """
         Fetches a batch of issues for a project, ordered by creation date.
+        If `updated_since` (a Jira timestamp) is given, only issues updated
+        at or after it are returned.
         """
         print(f"Fetching issues for {project_key} (startAt={start_at})...")
-        url = f"{self.BASE_URL}/search"
-        
-        # JQL: Order by 'created' date ASC to ensure a stable order for pagination
-        jql = f"project = '{project_key}' ORDER BY created ASC"
-        
+
+        # JQL: Order by 'created' date ASC to ensure a stable order for pagination.
+        # 'updated' only ever increases, so the filter can add issues mid-scrape but never drop
+        # them; the worst case is an issue fetched twice, never one skipped. Being rounded down,
+        # it also returns issues last updated just before `updated_since`; callers drop those.
+        jql = f"project = '{project_key}'"
+        if updated_since:
+            jql += f" AND updated >= '{to_jql_datetime(updated_since)}'"
+        jql += " ORDER BY created ASC"
+
         # Optimize: Only request fields you actually need!
         fields = [
-            "summary", "description", "comment", "status", "priority", 
+            "summary", "description", "comment", "status", "priority",
             "labels", "issuetype", "reporter", "assignee", "created", "updated",
             "project" # Need project for the processor
         ]
-        
+
         params = {
             "jql": jql,
             "startAt": start_at,
             "maxResults": max_results,
-            "fields": ",".join(fields)
+            "fields": ",".join(fields),
+            # Don't expand anything (e.g. renderedFields, which duplicates every text field as HTML)
+            "expand": ""
         }
-        
-        response = self._make_request("GET", url, params=params)
-        
-        # If we exit the retry loop and still have a bad response, raise an error
-        if response.status_code != 200:
-            raise Exception(f"Failed to fetch data after retries. Final status: {response.status_code} {response.text}")
-            
-        return response.json()
\ No newline at end of file
+
+        return await self._search(params)
+
+    async def get_latest_update(self, project_key):
+        """
+        Returns the most recent 'updated' timestamp of any issue in the project,
+        or None if the project has no issues.
+        """
+        params = {
+            "jql": f"project = '{project_key}' ORDER BY updated DESC",
+            "maxResults": 1,
+            "fields": "updated"
+        }
+        issues = (await self._search(params)).get("issues")
+        return issues[0]["fields"]["updated"] if issues else None
\ No newline at end of file
@@ -4,4 +4,29 @@ PROJECTS = [
     'SPARK',  # Apache Spark
     'HADOOP', # Apache Hadoop
     'KAFKA'   # Apache Kafka
-]
\ No newline at end of file
+]
+
+# Maximum number of search requests in flight at once per project.
+# Keep this modest to stay within Jira's rate limits.
+CONCURRENCY = 10
+
+# Maximum number of API requests started per second per project.
+# Staying under Jira's limit avoids 429s and the retry backoff they trigger.
+REQUESTS_PER_SECOND = 8
+
+# Checkpoint progress after at least this many batches have been written.
+# State is always saved on exit; a hard crash re-scrapes roughly this many batches.
+CHECKPOINT_EVERY = 10
+
+# Issues whose cleaned description + comment text is shorter than this
+# carry no useful training signal and are skipped entirely.
+MIN_TEXT_LENGTH = 19
+
+# Clean Jira markup with RE2 (pip install google-re2) instead of `re`. RE2 runs in
+# guaranteed linear time, but its Python binding is many times slower per match,
+# so only turn this on if pathological issue bodies are stalling the workers.
+USE_RE2 = False
+
+# Validate every sample against the Pydantic schema before writing it.
+# This is slow, so leave it off unless you are debugging malformed data.
+VALIDATE_SAMPLES = False
\ No newline at end of file
@@ -1,71 +1,215 @@
-import jsonlines
-import time
-from api import JiraAPI
-from processor import process_issue
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+import zstandard as zstd
+from api import AsyncJiraAPI, parse_jira_datetime
+from processor import process_and_encode_batch
 from state_manager import load_state, save_state
 import config
 
-def scrape_project(project_key):
+def checkpoint(raw, stream, project_key, start_at, watermark, next_watermark, frame_open=True):
+    """
+    Makes everything written so far durable, then records where to resume.
+    `frame_open` says whether anything was written since the last zstd frame ended.
+    """
+    # End the zstd frame so the file is decodable up to this point. Ending one
+    # with nothing in it would still write an empty frame, so that is skipped.
+    if frame_open:
+        stream.flush(zstd.FLUSH_FRAME)
+    raw.flush()
+    os.fsync(raw.fileno())
+    save_state(project_key, start_at, watermark, next_watermark, raw.tell())
+
+def truncate_output(raw, stream, offset, frame_open=True):
+    """
+    Drops everything written after `offset`, which must be the end of a zstd frame.
+    """
+    # End the open frame first, so the compressor starts a fresh one afterwards
+    if frame_open:
+        stream.flush(zstd.FLUSH_FRAME)
+    raw.flush()
+    raw.truncate(offset)
+    # truncate() doesn't move the position, and tell() is used for the saved size
+    raw.seek(offset)
+
+def updated_after(raw_issues, watermark):
+    """
+    Drops the issues not updated after `watermark`. The JQL filter is inclusive and
+    has minute precision, so it also returns issues the previous pass already wrote.
+    """
+    if not watermark:
+        return raw_issues
+    since = parse_jira_datetime(watermark)
+    return [
+        raw_issue for raw_issue in raw_issues
+        # Keep an issue whose update time is unknown; a duplicate beats a gap
+        if not raw_issue.get("fields", {}).get("updated")
+        or parse_jira_datetime(raw_issue["fields"]["updated"]) > since
+    ]
+
+async def fetch_window(api, project_key, starts, max_results, page_size, watermark):
+    """
+    Fetches the pages of one window concurrently. If any page fails, the
+    others are cancelled rather than left running after the client closes.
+    """
+    # Small courtesy delay
+    await asyncio.sleep(0.5)
+    tasks = [
+        asyncio.ensure_future(api.search_issues(project_key, s, max_results, watermark))
+        for s in starts
+    ]
+    try:
+        batches = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    # The pages were requested at fixed offsets, so a short page before
+    # the last one would leave a gap or an overlap in the corpus
+    for batch_data in batches[:-1]:
+        if len(batch_data.get("issues", [])) != page_size:
+            raise Exception(f"Expected {page_size} issues per page from {project_key}, got {len(batch_data.get('issues', []))}")
+    return batches
+
+async def scrape_project(project_key, pool):
     """
     Main scraping pipeline for a single project.
     """
     print(f"--- Starting scrape for project: {project_key} ---")
-    
-    api = JiraAPI()
-    output_file = f"{project_key}_corpus.jsonl"
-    
-    # 1. Resume from last state
-    start_at = load_state(project_key)
+
+    loop = asyncio.get_running_loop()
+    output_file = f"{project_key}_corpus.jsonl.zst"
+
+    # 1. Resume from last state. Once a project has been scraped in full, each
+    # later pass only fetches the issues updated since the previous pass began.
+    start_at, watermark, next_watermark, output_size = load_state(project_key)
+    pass_complete = False
     total_processed_in_session = 0
+    batches_since_checkpoint = 0
+    window_offset = None  # Where the window being written began, while it is being written
+    frame_open = False  # Whether anything was written since the last zstd frame ended
     max_results = 50  # API batch size (50 is a common default)
-    
-    # 'a' mode appends to the file. If it doesn't exist, it's created.
-    with jsonlines.open(output_file, mode='a') as writer:
-        while True:
+
+    async with AsyncJiraAPI(concurrency=config.CONCURRENCY, requests_per_second=config.REQUESTS_PER_SECOND) as api:
+        # 'ab' mode appends to the file. If it doesn't exist, it's created.
+        with open(output_file, 'ab') as raw:
+            # Samples are zstd-compressed as they are written; the compressor also
+            # batches them into a few large write() calls. The writer is never closed:
+            # the exit checkpoint ends the last frame, and closing would add an empty one.
+            stream = zstd.ZstdCompressor(level=3).stream_writer(raw, closefd=False)
+
+            # Drop anything written after the last checkpoint (e.g. a half-written frame
+            # left by a hard kill), so new frames are never appended after a corrupt one.
+            if output_size is not None and raw.tell() > output_size:
+                truncate_output(raw, stream, output_size, frame_open)
+            elif output_size is None:
+                # Nothing to cut back to yet (a new project, or older state without sizes):
+                # record the size now, so a crash before the first checkpoint can't corrupt the file
+                save_state(project_key, start_at, watermark, next_watermark, raw.tell())
+
             try:
-                # 2. Fetch a batch of issues
-                batch_data = api.search_issues(project_key, start_at, max_results)
-                
-                if not batch_data or not batch_data.get("issues"):
-                    print(f"No more issues found for {project_key} at startAt={start_at}.")
-                    break
-                
-                issues = batch_data.get("issues", [])
-                
-                # 3. Transform and Write each issue
-                for raw_issue in issues:
-                    llm_sample = process_issue(raw_issue)
-                    if llm_sample:
-                        # Pydantic's .dict() is deprecated; use .model_dump()
-                        writer.write(llm_sample.model_dump()) 
-                
-                batch_size = len(issues)
-                total_processed_in_session += batch_size
-                
-                # 4. Update state for next loop
-                start_at += batch_size
-                save_state(project_key, start_at) # Save state *after* successful batch
-                
-                print(f"Processed batch for {project_key}. Issues {start_at - batch_size} to {start_at}. Total this session: {total_processed_in_session}")
-                
-                # Check if we're at the end
-                total_available = batch_data.get("total", 0)
-                if start_at >= total_available:
-                    print(f"Finished project {project_key}. Scraped all {total_available} issues.")
-                    break
-                
-                # Small courtesy delay
-                time.sleep(0.5) 
+                if start_at == 0 or next_watermark is None:
+                    # Starting a new pass: anything updated after this point is left to the next one
+                    next_watermark = await api.get_latest_update(project_key)
+                if watermark:
+                    print(f"Only fetching {project_key} issues updated since {watermark}.")
+
+                # 2. Fetch the first batch on its own to learn how many issues there are,
+                # and how many Jira actually returns per page (it may cap maxResults)
+                batches = [await api.search_issues(project_key, start_at, max_results, watermark)]
+                page_size = batches[0].get("maxResults") or max_results
+
+                while True:
+                    issues = [raw_issue for batch_data in batches if batch_data for raw_issue in batch_data.get("issues", [])]
+                    if not issues:
+                        print(f"No more issues found for {project_key} at startAt={start_at}.")
+                        pass_complete = True
+                        return
+
+                    # 3. Hand the window to the process pool, one batch per task, for cleaning,
+                    # validation and JSON encoding...
+                    futures = [
+                        loop.run_in_executor(pool, process_and_encode_batch, updated_after(batch_data.get("issues", []), watermark))
+                        for batch_data in batches if batch_data
+                    ]
+
+                    # 4. ...and fetch the next window concurrently while the workers run.
+                    # New issues may have been created meanwhile, so trust the latest total.
+                    window_size = len(issues)
+                    next_start = start_at + window_size
+                    total_available = batches[-1].get("total", 0)
+                    prefetch = None
+                    if next_start < total_available:
+                        window_end = min(total_available, next_start + page_size * config.CONCURRENCY)
+                        prefetch = asyncio.ensure_future(fetch_window(
+                            api, project_key, range(next_start, window_end, page_size), max_results, page_size, watermark
+                        ))
+
+                    # 5. Write each batch's encoded samples as soon as its worker finishes
+                    window_offset = raw.tell()
+                    try:
+                        for future in asyncio.as_completed(futures):
+                            encoded = await future
+                            if encoded:
+                                stream.write(encoded)
+                                frame_open = True
+                    except BaseException:
+                        if prefetch is not None:
+                            prefetch.cancel()
+                            await asyncio.gather(prefetch, return_exceptions=True)
+                        raise
+
+                    # 6. End the window's zstd frame, checkpointing every few batches. With a frame
+                    # per window, a window that fails partway through can be cut off where it began.
+                    batches_since_checkpoint += len(batches)
+                    if batches_since_checkpoint >= config.CHECKPOINT_EVERY:
+                        checkpoint(raw, stream, project_key, next_start, watermark, next_watermark, frame_open) # Save state *after* successful window
+                        batches_since_checkpoint = 0
+                    elif frame_open:
+                        stream.flush(zstd.FLUSH_FRAME)
+                    frame_open = False
+                    window_offset = None
+
+                    # Update state for next loop
+                    start_at = next_start
+                    total_processed_in_session += window_size
+
+                    print(f"Processed batch for {project_key}. Issues {start_at - window_size} to {start_at}. Total this session: {total_processed_in_session}")
+
+                    if prefetch is None:
+                        print(f"Finished project {project_key}. Scraped all {total_available} issues.")
+                        pass_complete = True
+                        return
+                    # A failed prefetch only surfaces here, after this window has been written
+                    batches = await prefetch
 
             except Exception as e:
                 print(f"A critical error occurred: {e}. Stopping.")
-                print(f"Last successful state saved: project {project_key} at startAt={start_at}")
-                # The state is not saved for this failed batch,
+                print(f"Saving last successful state: project {project_key} at startAt={start_at}")
+                # The state is not saved for this failed window,
                 # so it will retry from the last successful 'start_at' index on next run.
-                break
+            finally:
+                # Always checkpoint on the way out (finished, failed or interrupted),
+                # so completed windows since the last checkpoint aren't scraped twice.
+                if pass_complete:
+                    # The next pass starts over, but only for issues updated since this one began
+                    start_at, watermark, next_watermark = 0, next_watermark or watermark, None
+                elif window_offset is not None:
+                    # A window failed partway through being written; drop its samples, since
+                    # start_at still points at its beginning and it will be scraped again
+                    truncate_output(raw, stream, window_offset, frame_open)
+                    frame_open = False
+                checkpoint(raw, stream, project_key, start_at, watermark, next_watermark, frame_open)
 
-if __name__ == "__main__":
+async def main():
     print("Starting Jira LLM Corpus Scraper...")
-    for project in config.PROJECTS:
-        scrape_project(project)
-    print("--- All scraping jobs complete. ---")
\ No newline at end of file
+    # Cleaning and validation are CPU-bound, so run them on every core
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+        for project in config.PROJECTS:
+            await scrape_project(project, pool)
+    print("--- All scraping jobs complete. ---")
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
@@ -1,30 +1,77 @@
 import re
-from pydantic import BaseModel, ValidationError, Field
+import orjson
+from pydantic import ValidationError
 from typing import List, Optional, Dict, Any
+import config
 
-# --- 1. Define the Target LLM Schema ---
-# This model *enforces* the clean structure.
-class LLMTrainingSample(BaseModel):
-    issue_key: str
-    project: str
-    created_at: str
-    updated_at: str
-    status: str
-    priority: str
-    issue_type: str
-    reporter: Optional[str] = None
-    assignee: Optional[str] = None
-    labels: List[str]
-    
-    # The cleaned, unstructured text
-    title: str
-    description_text: str
-    comments_text: str
-    
-    # The derived tasks for an instruction-tuned LLM
-    derived_tasks: List[Dict[str, str]]
+# RE2 (pip install google-re2) matches in linear time, so huge or pathological
+# bodies can't stall a worker with backtracking, but its Python binding is much
+# slower per match than `re`; it is opt-in via `config.USE_RE2`. The patterns
+# below avoid backreferences and lookarounds, so either engine works.
+if config.USE_RE2:
+    import re2 as regex_engine  # type: ignore[import-untyped, no-redef]
+else:
+    regex_engine = re
+
+# --- 1. The Target LLM Schema ---
+# Defined in schema.py, which stays pure Python so processor.py can be
+# compiled with mypyc (it can't compile Pydantic models).
+from schema import LLMTrainingSample
 
 # --- 2. Helper for cleaning Jira's markup ---
+# Formatting characters (*bold*, _italic_, -strike-, +under+, ^super^, ~sub~)
+# are deleted in one C-level pass with str.translate.
+_FORMAT_CHARS_TABLE = str.maketrans('', '', '*_+^~-')
+
+# Literal tokens are dropped with str.replace before the regex runs
+_LITERAL_TOKENS = ('{noformat}', '{quote}', '!image.png|thumbnail!')
+
+# Separates comment bodies so an issue's comments can be cleaned in one pass.
+# It isn't whitespace, and no markup pattern below matches across it.
+_COMMENT_SEP = '\x01'
+
+# Everything that genuinely needs a regex is matched in a single pass with one
+# named alternation, instead of walking the text once per pattern. Flags are
+# inline so the pattern compiles identically under RE2 and `re`, and scoped so
+# only the patterns that were case-insensitive before still are.
+# Alternatives are grouped by their first character, so the engine can skip
+# straight past plain text to the next '{', '[' or '!' instead of trying every
+# alternative at every position.
+_JIRA_MARKUP_RE = regex_engine.compile(
+    r'\{(?:'
+        r'(?i:'                                            # IGNORECASE, for the block macros only
+            r'(?P<code>code:[^\x01]*?\})'                  # {code...} blocks
+            r'|(?P<noformat>noformat\})'                   # {NOFORMAT} etc. missed by the literal pass
+            r'|(?P<quote>quote\})'                         # {QUOTE} etc. missed by the literal pass
+            r'|(?P<panel>panel:[^\x01]*?\})'               # panel macros
+        r')'
+        r'|(?P<color>color:[^}\n\x01]*\})'                 # color markup (case-sensitive, one line)
+    r')'
+    r'|\[(?:'
+        r'(?P<link>(?P<link_text>[^|\]\n\x01]*)\|[^\]\n\x01]*\])' # [links|...] on one line
+        r'|(?P<url>(?:https?|ftp)://[^\]\n\x01]*\])'       # standalone links [http...] on one line
+    r')'
+    r'|(?i:(?P<image>!image\.png\|thumbnail!))'           # image thumbnails in any case
+)
+
+# What each kind of markup is replaced with (links are handled separately)
+_MARKUP_REPLACEMENTS = {
+    "code": " ",
+    "noformat": " ",
+    "quote": " ",
+    "panel": " ",
+    "image": " ",
+    "url": " ",
+    "color": "",
+}
+
+def _replace_markup(match: Any) -> str:
+    """Substitution callback for `_JIRA_MARKUP_RE`."""
+    if match.lastgroup == "link":
+        # Keep text from links
+        return match.group("link_text")
+    return _MARKUP_REPLACEMENTS[match.lastgroup]
+
 def clean_jira_text(text: Optional[str]) -> str:
     """
     A simple cleaner for Jira's wiki markup.
@@ -32,35 +79,15 @@ def clean_jira_text(text: Optional[str]) -> str:
     """
     if not text:
         return ""
-    
-    # Remove {code...} blocks
-    text = re.sub(r'\{code:.*?\}', ' ', text, flags=re.DOTALL | re.IGNORECASE)
-    # Remove {noformat...} blocks
-    text = re.sub(r'\{noformat\}', ' ', text, flags=re.DOTALL | re.IGNORECASE)
-    # Remove {quote...} blocks
-    text = re.sub(r'\{quote\}', ' ', text, flags=re.DOTALL | re.IGNORECASE)
-    
-    # Remove panel macros
-    text = re.sub(r'\{panel:.*?\}', ' ', text, flags=re.DOTALL | re.IGNORECASE)
-    
-    # Remove image thumbnails
-    text = re.sub(r'!image.png\|thumbnail!', ' ', text, flags=re.IGNORECASE)
-    
-    # Remove [links|...]
-    text = re.sub(r'\[(.*?)\|.*?\]', r'\1', text) # Keep text from links
-    
-    # Remove standalone links [http...]
-    text = re.sub(r'\[(https?|ftp)://.*?\]', ' ', text)
-    
-    # Remove formatting characters: *bold*, _italic_, -strike-, +under+, ^super^, ~sub~
-    text = re.sub(r'[\*_+\^~-]', '', text)
-    
-    # Remove color markup
-    text = re.sub(r'\{color:.*?\}', '', text)
-    
-    # Normalize whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
+
+    text = text.translate(_FORMAT_CHARS_TABLE)
+    for token in _LITERAL_TOKENS:
+        text = text.replace(token, ' ')
+
+    text = _JIRA_MARKUP_RE.sub(_replace_markup, text)
+
+    # Normalize whitespace (str.split() splits on the same characters as `\s`)
+    return " ".join(text.split())
 
 def _get_name(field: Optional[Dict[str, Any]]) -> Optional[str]:
     """Safely get a 'name' or 'displayName' from a Jira user/status field."""
@@ -68,11 +95,28 @@ def _get_name(field: Optional[Dict[str, Any]]) -> Optional[str]:
         return field.get("displayName", field.get("name"))
     return None
 
+def _clean_comments(comments: Optional[List[Dict[str, Any]]]) -> List[str]:
+    """
+    Cleans all comment bodies of an issue with a single call to
+    clean_jira_text, by joining them with a sentinel and splitting after.
+    """
+    if not comments:
+        return []
+    bodies = [comment.get("body") or "" for comment in comments]
+    cleaned = clean_jira_text(_COMMENT_SEP.join(bodies)).split(_COMMENT_SEP)
+    if len(cleaned) != len(bodies):
+        # A body contained the sentinel itself; clean them one at a time
+        return [clean_jira_text(body) for body in bodies]
+    return [text.strip() for text in cleaned]
+
+# Sample fields the schema types as plain `str`, which must not be None
+_REQUIRED_FIELDS = ("issue_key", "project", "created_at", "updated_at", "status", "priority", "issue_type", "title")
+
 # --- 3. The Transformation Function ---
-def process_issue(raw_issue: Dict[str, Any]) -> Optional[LLMTrainingSample]:
+def process_issue(raw_issue: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
-    Transforms a single raw issue JSON from the API into our clean
-    LLMTrainingSample.
+    Transforms a single raw issue JSON from the API into a dict matching
+    our clean LLMTrainingSample schema.
     """
     try:
         fields = raw_issue.get("fields", {})
@@ -82,60 +126,67 @@ def process_issue(raw_issue: Dict[str, Any]) -> Optional[LLMTrainingSample]:
         description = clean_jira_text(fields.get("description"))
         
         # Combine all comments into a single text block
-        comments_list = []
-        if fields.get("comment", {}).get("comments"):
-            for comment in fields["comment"]["comments"]:
-                comments_list.append(clean_jira_text(comment.get("body")))
+        comments_list = _clean_comments(fields.get("comment", {}).get("comments"))
         comments_text = "\n---\n".join(comments_list)
-        
+
+        # Issues without substantial text carry no useful training signal;
+        # skip them before doing any task construction.
+        if len(description) + len(comments_text) < config.MIN_TEXT_LENGTH:
+            return None
+
+        # Look up each name once; they are used by the tasks and the sample
+        issue_key = raw_issue.get("key")
+        priority_name = _get_name(fields.get("priority"))
+        type_name = _get_name(fields.get("issuetype"))
+        status_name = _get_name(fields.get("status"))
+
         # --- 4. Generate Derived Tasks ---
         tasks = []
 
+        # Build the task inputs once; the Q&A and classification tasks all share one
+        short_input = f"Title: {title}\nDescription: {description}"
+        full_text = f"{short_input}\nComments: {comments_text}"
+
         # Task 1: Summarization (using title as the summary)
-        full_text = f"Title: {title}\nDescription: {description}\nComments: {comments_text}"
-        if len(full_text) > len(title) + 50: # Only create task if text is substantial
-            tasks.append({
-                "instruction": "Summarize the following issue report.",
-                "input": full_text,
-                "output": title 
-            })
+        tasks.append({
+            "instruction": "Summarize the following issue report.",
+            "input": full_text,
+            "output": title
+        })
         
         # Task 2: Q&A - Priority
-        priority_name = _get_name(fields.get("priority"))
         if priority_name:
             tasks.append({
-                "instruction": f"What is the priority of issue {raw_issue.get('key')}?",
-                "input": f"Title: {title}\nDescription: {description}",
+                "instruction": f"What is the priority of issue {issue_key}?",
+                "input": short_input,
                 "output": priority_name
             })
         
         # Task 3: Q&A - Issue Type
-        type_name = _get_name(fields.get("issuetype"))
         if type_name:
             tasks.append({
-                "instruction": f"What is the issue type for {raw_issue.get('key')}?",
-                "input": f"Title: {title}\nDescription: {description}",
+                "instruction": f"What is the issue type for {issue_key}?",
+                "input": short_input,
                 "output": type_name
             })
         
         # Task 4: Classification - Status
-        status_name = _get_name(fields.get("status"))
         if status_name:
              tasks.append({
                 "instruction": "Classify the current status of this issue.",
-                "input": f"Title: {title}\nDescription: {description}",
+                "input": short_input,
                 "output": status_name
             })
 
-        # Use Pydantic to validate and build the clean object
-        sample = LLMTrainingSample(
-            issue_key=raw_issue.get("key"),
+        # Build the clean sample as a plain dict, ready for serialization
+        sample = dict(
+            issue_key=issue_key,
             project=_get_name(fields.get("project")),
             created_at=fields.get("created"),
             updated_at=fields.get("updated"),
-            status=_get_name(fields.get("status")),
-            priority=_get_name(fields.get("priority")),
-            issue_type=_get_name(fields.get("issuetype")),
+            status=status_name,
+            priority=priority_name,
+            issue_type=type_name,
             reporter=_get_name(fields.get("reporter")),
             assignee=_get_name(fields.get("assignee")),
             labels=fields.get("labels", []),
@@ -144,6 +195,16 @@ def process_issue(raw_issue: Dict[str, Any]) -> Optional[LLMTrainingSample]:
             comments_text=comments_text,
             derived_tasks=tasks
         )
+
+        # A full Pydantic validation pass is slow, so only run it when debugging
+        if config.VALIDATE_SAMPLES:
+            sample = LLMTrainingSample.model_validate(sample).model_dump()
+        else:
+            # Still drop issues missing a required field, as validation would
+            missing = [name for name in _REQUIRED_FIELDS if sample[name] is None]
+            if missing:
+                print(f"Data validation error for issue {issue_key}: missing {', '.join(missing)}")
+                return None
         return sample
 
     except ValidationError as e:
@@ -152,4 +213,22 @@ def process_issue(raw_issue: Dict[str, Any]) -> Optional[LLMTrainingSample]:
         return None
     except Exception as e:
         print(f"Unexpected error processing issue {raw_issue.get('key')}: {e}")
-        return None
\ No newline at end of file
+        return None
+
+# --- 5. The Process Pool Entry Point ---
+def process_and_encode_batch(raw_issues: List[Dict[str, Any]]) -> bytes:
+    """
+    Transforms a batch of raw issues and returns the samples already encoded
+    as JSONL, so the main process only has to write the bytes out.
+    """
+    lines = []
+    for raw_issue in raw_issues:
+        sample = process_issue(raw_issue)
+        if sample:
+            try:
+                # JSONL is one object per line
+                lines.append(orjson.dumps(sample, option=orjson.OPT_APPEND_NEWLINE))
+            except orjson.JSONEncodeError as e:
+                # e.g. an integer wider than 64 bits, which orjson refuses to encode
+                print(f"Encoding error for issue {raw_issue.get('key')}: {e}")
+    return b"".join(lines)
\ No newline at end of file
@@ -0,0 +1,26 @@
+from pydantic import BaseModel
+from typing import List, Optional, Dict
+
+# --- The Target LLM Schema ---
+# This model describes the clean structure. It is only fully enforced when
+# `config.VALIDATE_SAMPLES` is on; otherwise the hot path emits plain dicts and
+# only drops issues missing a required (non-Optional) field.
+class LLMTrainingSample(BaseModel):
+    issue_key: str
+    project: str
+    created_at: str
+    updated_at: str
+    status: str
+    priority: str
+    issue_type: str
+    reporter: Optional[str] = None
+    assignee: Optional[str] = None
+    labels: List[str]
+    
+    # The cleaned, unstructured text
+    title: str
+    description_text: str
+    comments_text: str
+    
+    # The derived tasks for an instruction-tuned LLM
+    derived_tasks: List[Dict[str, str]]
\ No newline at end of file
@@ -1,11 +1,37 @@
 import json
 import os
+import sqlite3
 
-STATE_FILE_TEMPLATE = "{project_key}_state.json"
+# All projects share one SQLite database. In WAL mode each checkpoint is a
+# small append to the log instead of a full rewrite of a per-project file.
+STATE_DB = "scraper_state.db"
 
-def load_state(project_key):
-    """Loads the last successful 'startAt' index for the project."""
-    state_file = STATE_FILE_TEMPLATE.format(project_key=project_key)
+# Per-project JSON files written by older versions, read once to resume from
+LEGACY_STATE_FILE_TEMPLATE = "{project_key}_state.json"
+
+_connection = None
+
+def _get_connection():
+    """Opens (and if needed creates) the shared state database on first use."""
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(STATE_DB)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        # Safe with WAL: a power loss can only roll back the latest checkpoints,
+        # which just means re-scraping those batches.
+        _connection.execute("PRAGMA synchronous=NORMAL")
+        _connection.execute("CREATE TABLE IF NOT EXISTS state (project TEXT PRIMARY KEY, start_at INTEGER NOT NULL)")
+        # These columns were added later; upgrade databases created without them
+        columns = {row[1] for row in _connection.execute("PRAGMA table_info(state)")}
+        for column, column_type in (("watermark", "TEXT"), ("next_watermark", "TEXT"), ("output_size", "INTEGER")):
+            if column not in columns:
+                _connection.execute(f"ALTER TABLE state ADD COLUMN {column} {column_type}")
+        _connection.commit()
+    return _connection
+
+def _load_legacy_state(project_key):
+    """Loads the 'startAt' index from an old per-project JSON state file, if any."""
+    state_file = LEGACY_STATE_FILE_TEMPLATE.format(project_key=project_key)
     if os.path.exists(state_file):
         try:
             with open(state_file, 'r') as f:
@@ -16,8 +42,28 @@ def load_state(project_key):
             return 0
     return 0
 
-def save_state(project_key, start_at):
-    """Saves the *next* 'startAt' index to process."""
-    state_file = STATE_FILE_TEMPLATE.format(project_key=project_key)
-    with open(state_file, 'w') as f:
-        json.dump({"startAt": start_at}, f)
\ No newline at end of file
+def load_state(project_key):
+    """
+    Loads the scrape state for the project as a (start_at, watermark, next_watermark, output_size) tuple:
+    - start_at: the last successful 'startAt' index within the current pass.
+    - watermark: the pass only covers issues updated at or after this Jira timestamp (None = all issues).
+    - next_watermark: the latest update in the project when the current pass began,
+      which becomes the watermark once the pass completes.
+    - output_size: the size in bytes of the output file at the last checkpoint (None = unknown).
+    """
+    row = _get_connection().execute(
+        "SELECT start_at, watermark, next_watermark, output_size FROM state WHERE project = ?", (project_key,)
+    ).fetchone()
+    if row:
+        return row
+    return _load_legacy_state(project_key), None, None, None
+
+def save_state(project_key, start_at, watermark=None, next_watermark=None, output_size=None):
+    """Saves the *next* 'startAt' index to process, along with the pass's watermarks and the output size."""
+    connection = _get_connection()
+    # The transaction makes the update atomic; it commits on exit
+    with connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO state (project, start_at, watermark, next_watermark, output_size) VALUES (?, ?, ?, ?, ?)",
+            (project_key, start_at, watermark, next_watermark, output_size)
+        )
\ No newline at end of file